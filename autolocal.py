@@ -1,25 +1,50 @@
 import os
 import re
 import subprocess
+import sys
+import zipfile
+import zlib
 from pathlib import Path
 
+PLUGIN_VAULT_DIR = Path("/home/dfunk/Projects/AUTOLOCALWP")
+NGINX_TEMPLATE_FILE = Path(__file__).resolve().with_name("nginx_config_template.txt")
+VERSION_RE = re.compile(rb"Version:\s*([\d.]+)")
+
+
+def read_plugin_version(zip_path):
+    # WordPress only reads the first 8 KiB of a plugin's top-level PHP files for its header.
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            for name in archive.namelist():
+                if name.endswith(".php") and name.count("/") <= 1:
+                    with archive.open(name) as php_file:
+                        header = php_file.read(8192)
+                    if b"Plugin Name:" not in header:
+                        continue
+                    version_info = VERSION_RE.search(header)
+                    if version_info:
+                        return version_info.group(1).decode("ascii")
+    except (zipfile.BadZipFile, zlib.error, RuntimeError, OSError):
+        pass
+    return None
+
+
+def version_key(version):
+    return tuple(int(part) for part in version.split(".") if part)
+
 
 def find_highest_version(plugin):
     try:
-        plugin_dir = Path("/home/dfunk/Projects/AUTOLOCALWP/") / plugin
-        highest_version = "0"
-        highest_version_file = ""
-        for file in plugin_dir.glob("*.zip"):
-            if subprocess.run(["unzip", "-l", str(file), "*.php"], capture_output=True, text=True).stdout:
-                version_info = subprocess.run(["unzip", "-p", str(file), "*.php"], capture_output=True, text=True).stdout
-                version_info = re.search(r"Version:\s*([\d.]+)", version_info)
-                if version_info:
-                    version = version_info.group(1)
-                    if version > highest_version:
-                        highest_version = version
-                        highest_version_file = file
-        if highest_version_file:
-            return highest_version_file
+        plugin_dir = PLUGIN_VAULT_DIR / plugin
+        candidates = []
+        with os.scandir(plugin_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".zip") and entry.is_file():
+                    version = read_plugin_version(entry.path)
+                    if version:
+                        candidates.append((version_key(version), entry.path))
+        if candidates:
+            return max(candidates)[1]
         else:
             raise FileNotFoundError(f"No valid plugin zip files found in {plugin_dir}")
     except Exception as e:
@@ -27,17 +52,18 @@ def find_highest_version(plugin):
 
 
 def setup_nginx(domain):
-    with open("nginx_config_template.txt", "r") as template_file:
-        nginx_config = template_file.read().format(domain=domain)
-    with open(f"/etc/nginx/sites-available/{domain}", "w") as f:
+    nginx_config = NGINX_TEMPLATE_FILE.read_text().format(domain=domain)
+    vhost_file = f"/etc/nginx/sites-available/{domain}"
+    with open(f"{vhost_file}.tmp", "w") as f:
         f.write(nginx_config)
+    os.replace(f"{vhost_file}.tmp", vhost_file)
     run_command(
         "Creating symlink for Nginx configuration",
-        ["ln", "-s", f"/etc/nginx/sites-available/{domain}", f"/etc/nginx/sites-enabled/{domain}"]
+        ["ln", "-s", vhost_file, f"/etc/nginx/sites-enabled/{domain}"]
     )
     run_command(
-        "Restarting Nginx",
-        ["systemctl", "restart", "nginx"],
+        "Reloading Nginx",
+        ["systemctl", "reload-or-restart", "nginx"],
     )
     with open("/etc/hosts", "a") as f:
         f.write(f"127.0.0.1 {domain}.local\n")
@@ -45,17 +71,17 @@ def setup_nginx(domain):
 
 def run_command( desc, command ):
     try:
-        result = subprocess.run(command, check=True, capture_output=True, text=True)
-        error = re.sub(r'\\n', ' ', result.stdout)
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
         print(f"\033[92mSUCCE\033[0m '{desc}'")
     except subprocess.CalledProcessError as e:
-        error = re.sub(r'\\n', ' ', e.stderr)
-        print(f"\033[91mERROR\033[0m '{desc}'")
+        error = e.stderr.decode("utf-8", errors="replace").strip().replace("\n", " ")
+        print(f"\033[91mERROR\033[0m '{desc}' {error}")
 
 
 def setup_wordpress(domain):
+    site_dir = f"/var/www/{domain}"
     sudo_cmd = ["sudo", "-u", "dfunk", "-i", "--"]
-    wp_cmd = ["wp", f"--path=/var/www/{domain}"]
+    wp_cmd = ["wp", f"--path={site_dir}"]
     swp_cmd = sudo_cmd + wp_cmd
     plugins = {
         'uninstall': ["akismet", "hello"],
@@ -66,36 +92,45 @@ def setup_wordpress(domain):
     themes = {
         'install': ["hello-elementor"]
     }
+    # One wp eval instead of separate option/post commands, each of which would boot WordPress.
+    # No PHP variables: sudo -i hands the command to a login shell without escaping '$'.
+    reading_settings_php = (
+        "update_option('blog_public', '0');"
+        "update_option('page_on_front', wp_insert_post(['post_type' => 'page', 'post_title' => 'Home', 'post_status' => 'publish']))"
+        " or WP_CLI::error('Could not create Home page');"
+        "update_option('show_on_front', 'page');"
+    )
     setup_commands = [
-        ("Creating directory for WordPress installation", ["mkdir",  "-p", f"/var/www/{domain}"]),
         ("Downloading WordPress core",                    ["core",   "download"]),
         ("Creating WordPress configuration",              ["config", "create", "--dbname=" + domain, "--dbuser=funkad", "--dbpass="]),
         ("Creating WordPress database",                   ["db",     "create"]),
         ("Installing WordPress core",                     ["core",   "install", "--url=" + domain + ".local", "--title=" + domain, "--admin_user=FunkAd", "--admin_password=pass", "--admin_email=wordpress@" + domain + ".local"]),
-        ("Disabling search engine visibility",            ["option", "update", "blog_public", "0"]),
-        ("Creating home page",                            ["post",   "create", "--post_type=page", "--post_title=Home", "--post_status=publish"]),
-        ("Setting front page to static page",             ["option", "update", "show_on_front", "page"])
+        ("Configuring home page and visibility",          ["eval",   reading_settings_php])
     ]
     for description, command in setup_commands:
         run_command(description, swp_cmd + command)
-    os.chdir(f"/var/www/{domain}")
+    os.chdir(site_dir)
     for action, plugin_list in plugins.items():
-        for plugin in plugin_list:
-            if action == 'install_paid':
+        if action == 'install_paid':
+            paid_plugins = []
+            paid_files = []
+            for plugin in plugin_list:
                 highest_version_file = find_highest_version(plugin)
                 if highest_version_file:
-                    run_command(f"Installing plugin {plugin}", swp_cmd + ["plugin", "install", f"file://{highest_version_file}", "--activate"])
-            else:
-                run_command(f"{action.capitalize()}ing plugin {plugin}", swp_cmd + ["plugin", action, plugin])
+                    paid_plugins.append(plugin)
+                    paid_files.append(f"file://{highest_version_file}")
+            if paid_files:
+                run_command(f"Installing plugins {', '.join(paid_plugins)}", swp_cmd + ["plugin", "install"] + paid_files + ["--activate"])
+        elif plugin_list:
+            # wp-cli accepts several slugs per call, so each action costs one PHP/WordPress bootstrap.
+            run_command(f"{action.capitalize()}ing plugins {', '.join(plugin_list)}", swp_cmd + ["plugin", action] + plugin_list)
     for action, theme_list in themes.items():
-        for theme in theme_list:
-            run_command(f"{action.capitalize()}ing theme {theme}", swp_cmd + ["theme", action, theme])
-            if action == 'install':
-                run_command(f"Activating theme {theme}", swp_cmd + ["theme", "activate", theme])
+        if theme_list:
+            activate = ["--activate"] if action == 'install' else []
+            run_command(f"{action.capitalize()}ing themes {', '.join(theme_list)}", swp_cmd + ["theme", action] + theme_list + activate)
 
 
 if __name__ == "__main__":
-    import sys
     domain = sys.argv[1]
     setup_nginx(domain)
     setup_wordpress(domain)